@@ -0,0 +1,191 @@
+"""
+Benchmark the exec -> render pipeline using generated notebooks.
+
+Each axis (source length, sections, prints per loop, size of printed objects, markdown volume, plot count and
+plot size) is scaled separately while the others stay at their defaults. Results are saved as JSON so they can
+be compared between commits:
+
+    python benchmarks/run.py run
+    python benchmarks/run.py compare .benchmarks/<before>.json .benchmarks/<after>.json
+"""
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+import typer
+
+from notbook import cache, main
+from notbook.exec import exec_file, make_sections
+from notbook.render import render
+from notbook.render_tools import SourceHighlighter
+from notbook.version import VERSION
+
+try:
+    import bokeh
+except ImportError:
+    bokeh = None
+
+cli = typer.Typer()
+THIS_DIR = Path(__file__).parent.resolve()
+ROOT_DIR = THIS_DIR.parent
+
+DEFAULTS = dict(lines=100, sections=5, prints=1, print_size=5, markdown=1, plots=0, plot_size=100)
+AXES = {
+    'lines': [100, 1_000, 10_000],
+    'sections': [1, 10, 100],
+    'prints': [1, 10, 100],
+    'print_size': [5, 100, 1_000],
+    'markdown': [1, 10, 100],
+    'plots': [1, 5, 20],
+    'plot_size': [100, 10_000, 100_000],
+}
+PLOT_AXES = {'plots', 'plot_size'}
+
+
+def generate(
+    *, lines: int, sections: int, prints: int, print_size: int, markdown: int, plots: int, plot_size: int
+) -> str:
+    """
+    Generate a notebook script, lines is the approximate number of lines of code excluding prints and markdown.
+    """
+    out = []
+    if plots:
+        out += ['import numpy as np', 'from bokeh.plotting import figure', 'from notbook import show_plot', '']
+
+    paragraph = 'Some **markdown** with `code`, a [link](https://example.com) and _emphasis_.\n'
+    code_lines = max(lines // sections, 1)
+    for s in range(sections):
+        out += ['"""md', f'## Section {s}', '', *[paragraph] * markdown, '"""', f'# {{ Section {s}']
+        for i in range(code_lines):
+            out.append(f'value_{s}_{i} = {i} * 2 + len("{s}")')
+        out += [
+            'for i in range(10):',
+            *[f'    print(i, {{"key_{p}": list(range({print_size}))}})' for p in range(prints)],
+            f'# }} caption for section {s}',
+            '',
+        ]
+
+    for p in range(plots):
+        out += [
+            f'x = np.linspace(0, 10, {plot_size})',
+            'p = figure(title="plot")',
+            f'p.line(x, np.sin(x + {p}), legend_label="sin")',
+            'show_plot(p, title="plot")',
+            '',
+        ]
+    return '\n'.join(out)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    # untimed warm up so one off costs like compiling templates and loading lexers aren't included
+    func()
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'min': min(times), 'median': statistics.median(times), 'peak_memory': peak}
+
+
+def run_case(params: Dict[str, int], repeat: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        script = tmp_dir / 'bench.py'
+        file_text = generate(**params)
+        script.write_text(file_text)
+        output_dir = tmp_dir / 'output'
+        output_dir.mkdir()
+        cache_file = output_dir / cache.CACHE_FILE
+
+        sections = exec_file(script, file_text=file_text, cache_file=cache_file)
+        extra = cache.load(cache_file, file_text)
+        stages = {
+            'exec_file': measure(lambda: exec_file(script, file_text=file_text), repeat),
+            'make_sections': measure(lambda: make_sections(file_text, extra), repeat),
+            'render': measure(lambda: render(sections, highlighter=SourceHighlighter(file_text)), repeat),
+            'build': measure(lambda: main.build(script, output_dir, force=True), repeat),
+        }
+        return {'params': params, 'source_bytes': len(file_text), 'stages': stages}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        p = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    return p.stdout.strip() or None
+
+
+@cli.command()
+def run(
+    output: Path = typer.Option(None, help='where to save results, defaults to .benchmarks/<commit>.json'),
+    axis: List[str] = typer.Option(list(AXES), help='axes to benchmark, may be repeated'),
+    repeat: int = typer.Option(5, help='number of times to time each stage'),
+):
+    commit = git_commit()
+    results = []
+    for name in axis:
+        if name not in AXES:
+            raise typer.BadParameter(f'unknown axis {name!r}, options: {", ".join(AXES)}')
+        if name in PLOT_AXES and bokeh is None:
+            print(f'{name}: skipped, bokeh not installed')
+            continue
+        for value in AXES[name]:
+            params = {**DEFAULTS, name: value}
+            if name == 'plot_size':
+                params['plots'] = 1
+            case = run_case(params, repeat)
+            case['axis'] = name
+            results.append(case)
+            timings = '  '.join(f'{k}={v["median"] * 1000:0.2f}ms' for k, v in case['stages'].items())
+            print(f'{name}={value:<7} {timings}')
+
+    output = output or ROOT_DIR / '.benchmarks' / f'{commit or "unknown"}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'commit': commit,
+        'notbook_version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+    output.write_text(json.dumps(data, indent=2))
+    print(f'results saved to {output}')
+
+
+@cli.command()
+def compare(before: Path, after: Path):
+    """
+    Show the change in median time and peak memory for each case and stage between two result files.
+    """
+    before_data, after_data = json.loads(before.read_text()), json.loads(after.read_text())
+    print(f'{before_data["commit"]} -> {after_data["commit"]}')
+    before_cases = {(c['axis'], json.dumps(c['params'], sort_keys=True)): c for c in before_data['results']}
+    for case in after_data['results']:
+        old = before_cases.get((case['axis'], json.dumps(case['params'], sort_keys=True)))
+        if not old:
+            continue
+        axis = case['axis']
+        print(f'{axis}={case["params"][axis]}:')
+        for stage, new in case['stages'].items():
+            prev = old['stages'].get(stage)
+            if prev:
+                t = new['median'] / prev['median']
+                m = new['peak_memory'] / prev['peak_memory'] if prev['peak_memory'] else 1
+                print(f'  {stage:<14} time x{t:0.2f}  memory x{m:0.2f}')
+
+
+if __name__ == '__main__':
+    cli()
@@ -4,13 +4,6 @@ from types import FrameType
 from . import context
 from .models import PlotBlock
 
-try:
-    from bokeh import plotting as bokeh_plotting
-    from bokeh.embed import file_html as bokeh_file_html
-    from bokeh.plotting import Figure as BokehFigure
-except ImportError:
-    bokeh_plotting = None
-
 __all__ = ('show_plot',)
 
 plot_id = 0
@@ -19,8 +12,10 @@ plot_id = 0
 def show_plot(plot, *, title: str = None, filename: str = None):
     global plot_id
     if repr(plot.__class__) == "<class 'bokeh.plotting.figure.Figure'>":
-        assert bokeh_plotting is not None, 'could not find bokeh install'
-        assert isinstance(plot, BokehFigure), plot
+        # bokeh is imported lazily since it's optional and slow to import, if we get here it's already loaded
+        from bokeh import plotting as bokeh_plotting
+
+        assert isinstance(plot, bokeh_plotting.Figure), plot
         if context.is_active():
             frame = inspect.currentframe().f_back
             if plot.sizing_mode is None:
@@ -59,6 +54,8 @@ class FakeTemplate:
 
 
 def bokeh_figure_to_html(fig, frame: FrameType, title: str = None):
+    from bokeh.embed import file_html as bokeh_file_html
+
     t = FakeTemplate()
     bokeh_file_html(fig, (None, None), template=t, title=title)
     plot_script = t.context['plot_script'].strip('\n')
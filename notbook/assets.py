@@ -0,0 +1,170 @@
+import base64
+import hashlib
+import os
+import re
+import warnings
+from functools import lru_cache
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from markupsafe import Markup
+
+__all__ = 'ASSETS_DIR', 'HASHED_NAME', 'Assets'
+
+THIS_DIR = Path(__file__).parent.resolve()
+# included in the package, main.css is built from "assets/" by "make build-assets"
+STATIC_DIR = THIS_DIR / 'static'
+# directory in the output shared by all notebooks
+ASSETS_DIR = 'assets'
+HASH_LENGTH = 12
+BOKEH_JS = 'bokeh.min.js'
+HASHED_NAME = re.compile(rf'\.[0-9a-f]{{{HASH_LENGTH}}}\.\w+$')
+
+assets_gist = (
+    'https://gistcdn.githack.com/samuelcolvin/647671890d647695930ff74f1ca5bfc2/raw/'
+    '9bdb8ecebe25293cad8332cbb2a79d844cdfd9a3'
+)
+# used for files which aren't available locally
+remote_urls = {
+    'main.css': f'{assets_gist}/notbook.css',
+    'github.svg': f'{assets_gist}/github.png',
+    'reload.js': f'{assets_gist}/reload.js',
+}
+
+
+class Assets:
+    """
+    Static files used by a page. Files are copied to assets_dir with content-hashed names so they can be cached
+    indefinitely and shared by all notebooks in a build; with inline they're embedded in the page instead so
+    it can be viewed on its own. Files which aren't available locally are loaded from a CDN.
+    """
+
+    def __init__(self, assets_dir: Optional[Path] = None, page_dir: Optional[Path] = None, *, inline: bool = False):
+        self.assets_dir = assets_dir
+        self.page_dir = page_dir
+        self.inline = inline
+        # files used by pages: hashed name, or None if the file is loaded from a CDN
+        self.used: Dict[str, Optional[str]] = {}
+
+    def page_globals(self, *, reload: bool = False, bokeh: bool = False) -> Dict[str, str]:
+        g = {}
+        css = self.local('main.css')
+        if self.inline and css:
+            g['css_inline'] = inline_text(css)
+        else:
+            g['css_url'] = self.url(css, 'main.css')
+
+        icon = self.local('github.svg')
+        if self.inline and icon:
+            g['github_icon_url'] = 'data:image/svg+xml;base64,' + base64.b64encode(icon.read_bytes()).decode()
+        else:
+            g['github_icon_url'] = self.url(icon, 'github.svg')
+
+        if reload:
+            # only used when served by "notbook watch", so never inlined
+            g['reload_js_url'] = self.url(self.local('reload.js'), 'reload.js')
+
+        bokeh_path = bokeh and self.local(BOKEH_JS)
+        if bokeh_path:
+            if self.inline:
+                g['bokeh_js_inline'] = inline_text(bokeh_path)
+            elif self.assets_dir:
+                g['bokeh_js_url'] = self.url(bokeh_path, BOKEH_JS)
+        return g
+
+    def local(self, name: str) -> Optional[Path]:
+        """
+        Find a static file, None if it's not available locally. Files are recorded in used so the build manifest
+        can tell when they've changed.
+        """
+        path = source(name)
+        self.used[name] = current_name(path)
+        if self.used[name] is None and name in remote_urls:
+            warn_missing(name)
+        return path if self.used[name] else None
+
+    def url(self, path: Optional[Path], name: str) -> str:
+        if self.assets_dir is None or path is None:
+            return remote_urls[name]
+
+        hashed = self.used[name]
+        dst = self.assets_dir / hashed
+        if not dst.exists():
+            self.assets_dir.mkdir(parents=True, exist_ok=True)
+            # write then rename so pages built concurrently never see a partial file
+            tmp = dst.with_name(f'.{hashed}.{os.getpid()}')
+            tmp.write_bytes(path.read_bytes())
+            os.replace(tmp, dst)
+
+        return f'{self.rel_dir()}/{hashed}'
+
+    def rel_dir(self) -> str:
+        # relative so output can be viewed from the file system or served under any path
+        return Path(os.path.relpath(self.assets_dir, self.page_dir or self.assets_dir.parent)).as_posix()
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        Everything about assets which affects rendered pages, saved in the build manifest.
+        """
+        return {'inline': self.inline, 'dir': self.assets_dir and self.rel_dir(), 'used': self.used}
+
+    def is_fresh(self, recorded: Optional[Dict[str, Any]]) -> bool:
+        """
+        Check whether pages rendered with the assets recorded by manifest() would be unchanged.
+        """
+        if not recorded or recorded['inline'] != self.inline:
+            return False
+        if recorded['dir'] != (self.assets_dir and self.rel_dir()):
+            return False
+        for name, hashed in recorded['used'].items():
+            if current_name(source(name)) != hashed:
+                return False
+            if hashed and not self.inline and self.assets_dir and not (self.assets_dir / hashed).exists():
+                # asset deleted from the output directory
+                return False
+        return True
+
+
+@lru_cache(maxsize=None)
+def warn_missing(name: str) -> None:
+    # once per process, it's only expected when notbook is installed from a checkout without running build-assets
+    warnings.warn(
+        f'{STATIC_DIR / name} not found, loading it from {remote_urls[name]} instead, '
+        f'run "make build-assets" to build it',
+        stacklevel=4,
+    )
+
+
+def source(name: str) -> Optional[Path]:
+    return bokeh_js() if name == BOKEH_JS else STATIC_DIR / name
+
+
+def current_name(path: Optional[Path]) -> Optional[str]:
+    if path is None or not path.is_file():
+        return None
+    stat = path.stat()
+    return hashed_name(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=None)
+def hashed_name(path: Path, mtime: int, size: int) -> str:
+    h = hashlib.sha256(path.read_bytes()).hexdigest()[:HASH_LENGTH]
+    return f'{path.stem}.{h}{path.suffix}'
+
+
+def inline_text(path: Path) -> Markup:
+    # "</" would end the style or script tag early
+    return Markup(path.read_text('utf-8').replace('</', '<\\/'))
+
+
+def bokeh_js() -> Optional[Path]:
+    """
+    BokehJS from the installed bokeh package, so it always matches the version used to generate plots. bokeh isn't
+    imported since that's slow.
+    """
+    spec = find_spec('bokeh')
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = Path(spec.submodule_search_locations[0]) / 'server' / 'static' / 'js' / BOKEH_JS
+    return path if path.is_file() else None
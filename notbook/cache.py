@@ -0,0 +1,125 @@
+import ast
+import hashlib
+import json
+from dataclasses import fields, is_dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from . import models
+from .models import PlotBlock, PrintStatement
+
+__all__ = 'CACHE_FILE', 'HIGHLIGHT_CACHE_FILE', 'save', 'load', 'clear', 'load_highlights', 'save_highlights'
+
+CACHE_FILE = '.notbook-cache.json'
+HIGHLIGHT_CACHE_FILE = '.notbook-highlight.json'
+# increment when highlighting changes so highlights cached by older versions aren't used
+HIGHLIGHT_CACHE_VERSION = 2
+Extra = Union[PrintStatement, PlotBlock]
+
+
+def save(cache_file: Path, file_text: str, extra: List[Extra]) -> None:
+    """
+    Save the results of executing a script so it can be re-rendered without executing it again.
+
+    Line numbers of prints and plots are stored as references to AST nodes so they can be moved when
+    non-executable content (comments, section titles and captions, md/html blocks) is edited.
+    """
+    signature, positions = code_signature(file_text)
+    items = []
+    for obj in extra:
+        ref = find_node(positions, obj.line_no)
+        if ref is None:
+            # can't locate this line in the code, caching is not possible
+            clear(cache_file)
+            return
+        items.append({'node': ref, 'obj': simplify(obj)})
+    cache_file.write_text(json.dumps({'signature': signature, 'extra': items}))
+
+
+def load(cache_file: Path, file_text: str) -> Optional[List[Extra]]:
+    """
+    Load cached execution results, returns None if there's no cache or the executable code has changed.
+    """
+    try:
+        data = json.loads(cache_file.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+    try:
+        signature, positions = code_signature(file_text)
+    except SyntaxError:
+        return None
+    if signature != data['signature']:
+        return None
+
+    extra = []
+    for item in data['extra']:
+        index, attr = item['node']
+        obj = unsimplify(item['obj'])
+        obj.line_no = positions[index][0 if attr == 'lineno' else 1]
+        extra.append(obj)
+    return extra
+
+
+def clear(cache_file: Path) -> None:
+    if cache_file.exists():
+        cache_file.unlink()
+
+
+def load_highlights(cache_file: Path) -> Dict[str, str]:
+    try:
+        data = json.loads(cache_file.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != HIGHLIGHT_CACHE_VERSION:
+        return {}
+    return data['lines']
+
+
+def save_highlights(cache_file: Path, highlights: Dict[str, str]) -> None:
+    cache_file.write_text(json.dumps({'version': HIGHLIGHT_CACHE_VERSION, 'lines': highlights}))
+
+
+class StripText(ast.NodeTransformer):
+    """
+    Remove bare string expressions (md and html blocks, docstrings) which don't affect execution.
+    """
+
+    def visit_Expr(self, node: ast.Expr) -> Optional[ast.Expr]:
+        if isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            return None
+        return node
+
+
+def code_signature(file_text: str) -> Tuple[str, List[Tuple[int, int]]]:
+    tree = StripText().visit(ast.parse(file_text))
+    signature = hashlib.sha1(ast.dump(tree).encode()).hexdigest()
+    positions = [(n.lineno, n.end_lineno) for n in ast.walk(tree) if hasattr(n, 'lineno')]
+    return signature, positions
+
+
+def find_node(positions: List[Tuple[int, int]], line_no: int) -> Optional[Tuple[int, str]]:
+    for attr, i in (('lineno', 0), ('end_lineno', 1)):
+        for index, pos in enumerate(positions):
+            if pos[i] == line_no:
+                return index, attr
+
+
+def simplify(obj: Any) -> Any:
+    if is_dataclass(obj):
+        return {'*type': obj.__class__.__name__, **{f.name: simplify(getattr(obj, f.name)) for f in fields(obj)}}
+    elif isinstance(obj, list):
+        return [simplify(v) for v in obj]
+    else:
+        return obj
+
+
+def unsimplify(obj: Any) -> Any:
+    if isinstance(obj, dict) and '*type' in obj:
+        d: Dict[str, Any] = dict(obj)
+        cls = getattr(models, d.pop('*type'))
+        return cls(**{k: unsimplify(v) for k, v in d.items()})
+    elif isinstance(obj, list):
+        return [unsimplify(v) for v in obj]
+    else:
+        return obj
@@ -1,42 +1,183 @@
 import os
+import sys
 from pathlib import Path
 from time import time
+from typing import TYPE_CHECKING, Iterable, Optional
 
 import typer
 
-from . import main
-from .render_tools import ExecException
+from .limits import Limits
 from .version import VERSION
-from .watch import watch as _watch
+
+if TYPE_CHECKING:
+    from .main import Notebook
+
+# main, render_tools and watch are imported inside commands since they pull in aiohttp, jinja2, misaka etc.
+# which would otherwise slow down every invocation of the cli, including "notbook --version"
 
 cli = typer.Typer()
 file_default = typer.Argument(..., exists=True, file_okay=True, dir_okay=True, readable=True)
 dev_mode = 'NOTBOOK_DEV' in os.environ
+# results of build_notebook, also used as exit codes when building in a subprocess
+BUILD_COMPLETED, BUILD_FAILED, BUILD_SKIPPED = 0, 1, 3
+timeout_option = typer.Option(None, '--timeout', help='Maximum time in seconds the script may run for.')
+max_memory_option = typer.Option(
+    None, '--max-memory', help='Maximum memory (address space) in MB the script may use, not supported on windows.'
+)
+max_output_option = typer.Option(None, '--max-output', help='Maximum number of characters the script may print.')
+inline_option = typer.Option(
+    False, '--inline', help='Embed css, images and BokehJS in each page so it can be viewed without any other files.'
+)
+
+
+def get_limits(timeout: Optional[float], max_memory: Optional[int], max_output: Optional[int]) -> Optional[Limits]:
+    if timeout is None and max_memory is None and max_output is None:
+        return None
+    return Limits(timeout=timeout, memory=max_memory and max_memory * 1024 ** 2, output=max_output)
 
 
 @cli.command()
 def build(
     file: Path = file_default,
     output_dir: Path = typer.Argument(Path('site'), file_okay=False, dir_okay=True, readable=True),
+    timeout: float = timeout_option,
+    max_memory: int = max_memory_option,
+    max_output: int = max_output_option,
+    force: bool = typer.Option(
+        False, '--force', help="Clear the output directory and build notebooks even if their inputs haven't changed."
+    ),
+    inline: bool = inline_option,
+):
+    """
+    Build a script, or every script in a directory, notebooks whose inputs haven't changed are skipped.
+    """
+    from . import main
+
+    notebooks = main.find_notebooks(file, output_dir)
+    main.prepare_notebooks(output_dir, notebooks, force=force, inline=inline)
+    limits = get_limits(timeout, max_memory, max_output)
+    if not build_notebooks(notebooks.values(), output_dir, limits, force, inline):
+        raise typer.Exit(1)
+
+
+@cli.command()
+def render(
+    file: Path = file_default,
+    output_dir: Path = typer.Argument(Path('site'), file_okay=False, dir_okay=True, readable=True),
+    timeout: float = timeout_option,
+    max_memory: int = max_memory_option,
+    max_output: int = max_output_option,
+    inline: bool = inline_option,
 ):
-    print(f'executing {file} and saving output to {output_dir}...')
-    start = time()
+    """
+    Re-render a script, or every script in a directory, using the output of the last build, only re-executing
+    scripts whose code has changed.
+    """
+    from . import main
+    from .assets import ASSETS_DIR
+
+    notebooks = main.find_notebooks(file, output_dir)
+    main.prepare_notebooks(output_dir, notebooks, inline=inline)
+    to_build = []
+    for notebook in notebooks.values():
+        start = time()
+        path = notebook.exec_file_path
+        if main.build_cached(path, notebook.output_dir, assets_dir=output_dir / ASSETS_DIR, inline=inline):
+            print(f'rendered {path} from cached output in {time() - start:0.3f}s')
+        else:
+            print(f'code changed or no cached output found for {path}')
+            to_build.append(notebook)
+
+    limits = get_limits(timeout, max_memory, max_output)
+    if not build_notebooks(to_build, output_dir, limits, False, inline):
+        raise typer.Exit(1)
+
+
+def build_notebooks(
+    notebooks: Iterable['Notebook'], output_dir: Path, limits: Optional[Limits], force: bool, inline: bool
+) -> bool:
+    """
+    Build notebooks one after another, a failed notebook doesn't stop the others, returns False if any failed.
+
+    With a timeout each notebook is built in a subprocess which is killed if the script doesn't stop, e.g. because
+    it's stuck in C code and never sees the alarm signal.
+    """
+    from . import main, manifest
+    from .assets import ASSETS_DIR
+    from .limits import LimitExceeded, preload, run_in_subprocess
+
+    notebooks = list(notebooks)
+    if limits and limits.timeout:
+        preload(manifest.package_imports(nb.exec_file_path for nb in notebooks))
+    assets_dir = output_dir / ASSETS_DIR
+    failed = 0
+    for notebook in notebooks:
+        print(f'executing {notebook.exec_file_path} and saving output to {notebook.output_dir}...')
+        start = time()
+        args = notebook, assets_dir, limits, force, inline
+        if limits and limits.timeout:
+            result = run_in_subprocess(build_notebook_process, args, limits.timeout)
+            if result is None:
+                exc = LimitExceeded(f'build killed after exceeding timeout of {limits.timeout:0.1f}s')
+                main.write_error(notebook.output_dir, assets_dir, exc)
+                print(exc)
+                result = BUILD_FAILED
+        else:
+            result = build_notebook(*args)
+
+        if result == BUILD_COMPLETED:
+            print(f'build completed in {time() - start:0.3f}s')
+        elif result == BUILD_SKIPPED:
+            print('inputs unchanged since the last build, skipped')
+        else:
+            print(f'build failed after {time() - start:0.3f}s')
+            failed += 1
+    return not failed
+
+
+def build_notebook(notebook: 'Notebook', assets_dir: Path, limits: Optional[Limits], force: bool, inline: bool) -> int:
+    from . import main
+    from .render_tools import ExecException
+
     try:
-        main.build(file, output_dir, dev=dev_mode)
+        built = main.build(
+            notebook.exec_file_path,
+            notebook.output_dir,
+            dev=dev_mode,
+            limits=limits,
+            force=force,
+            assets_dir=assets_dir,
+            inline=inline,
+        )
     except ExecException as exc:
         print(exc.format('shell'))
-        print(f'build failed after {time() - start:0.3f}s')
-        raise typer.Exit(1)
+        return BUILD_FAILED
     else:
-        print(f'build completed in {time() - start:0.3f}s')
+        return BUILD_COMPLETED if built else BUILD_SKIPPED
+
+
+def build_notebook_process(*args) -> None:
+    # the result is returned as the exit code, other errors also exit with 1
+    sys.exit(build_notebook(*args))
 
 
 @cli.command()
 def watch(
     file: Path = file_default,
     output_dir: Path = typer.Argument(Path('.live'), file_okay=False, dir_okay=True, readable=True),
+    timeout: float = timeout_option,
+    max_memory: int = max_memory_option,
+    max_output: int = max_output_option,
+    port: int = typer.Option(8000, help='Port to serve output on.'),
+    workers: int = typer.Option(None, help='Maximum number of notebooks to build at once, defaults to min(4, cpus).'),
 ):
-    _watch(file, output_dir, dev=dev_mode)
+    """
+    Watch a script, or a directory of scripts, and serve the output, rebuilding when files change.
+    """
+    from .watch import DEFAULT_WORKERS, watch as _watch
+
+    limits = get_limits(timeout, max_memory, max_output)
+    _watch(file, output_dir, dev=dev_mode, limits=limits, port=port, workers=workers or DEFAULT_WORKERS)
 
 
 def version_callback(value: bool):
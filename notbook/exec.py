@@ -1,3 +1,5 @@
+import ast
+import asyncio
 import inspect
 import json
 import os
@@ -6,39 +8,101 @@ import sys
 from io import BufferedWriter
 from operator import attrgetter
 from pathlib import Path
+from types import TracebackType
 from typing import Any, List, Optional, Union
 
 from devtools import PrettyFormat
 
-from . import context
+from . import cache, context
+from .limits import LimitExceeded, Limits, apply_limits
 from .models import CodeBlock, PlotBlock, PrintArg, PrintBlock, PrintStatement, Section, TextBlock
 from .render_tools import ExecException
 
-__all__ = ('exec_file',)
+__all__ = 'exec_file', 'render_cached'
 
 MAX_LINE_LENGTH = 120
 LONG_LINE = 50
+# number of rows shown from both the start and end of tables, and maximum columns and cell length shown
+TABLE_ROWS = 10
+TABLE_COLUMNS = 20
+TABLE_CELL_LENGTH = 50
 pformat = PrettyFormat(simple_cutoff=LONG_LINE)
 
 
-def exec_file(file: Path) -> List[Section]:
-    file_text = file.read_text('utf-8')
+def exec_file(
+    file: Path, *, file_text: Optional[str] = None, cache_file: Optional[Path] = None, limits: Optional[Limits] = None,
+) -> List[Section]:
+    """
+    Execute a script and build sections from it, if cache_file is set the prints and plots captured are saved
+    there for use by render_cached.
+
+    If execution fails, the ExecException raised includes sections built from the output captured so far.
+
+    Scripts using top level await are run in an asyncio event loop.
+    """
+    if file_text is None:
+        file_text = file.read_text('utf-8')
 
     context.activate()
     os.environ['NOTBOOK'] = '1'
-    mp = MockPrint(file)
+    mp = MockPrint(file, max_output=limits and limits.output)
     exec_globals = dict(print=mp)
-    code = compile(file_text, str(file), 'exec')
     try:
-        exec(code, exec_globals)
-    except Exception:
-        raise ExecException(sys.exc_info())
+        code = compile(file_text, str(file), 'exec', flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+    except (SyntaxError, ValueError):
+        # nothing has run so there's no output to show
+        raise ExecException(sys.exc_info(), sections=[])
+    try:
+        with apply_limits(limits):
+            if code.co_flags & inspect.CO_COROUTINE:
+                # evaluating the module returns a coroutine
+                asyncio.run(eval(code, exec_globals))
+            else:
+                exec(code, exec_globals)
+    except (Exception, LimitExceeded):
+        exc_type, exc, tb = sys.exc_info()
+        exc_info = exc_type, exc, trim_traceback(tb, str(file))
+        raise ExecException(exc_info, sections=make_sections(file_text, mp.statements + context.get()))
 
-    lines: List[Union[str, PrintStatement, PlotBlock]] = file_text.split('\n')
+    extra = mp.statements + context.get()
+    if cache_file:
+        cache.save(cache_file, file_text, extra)
+    return make_sections(file_text, extra)
 
-    extra = sorted(mp.statements + context.get(), key=attrgetter('line_no'), reverse=True)
 
-    for p in extra:
+def trim_traceback(tb: TracebackType, filename: str) -> TracebackType:
+    """
+    Remove frames from running the event loop, so the traceback starts with the frame which called the script
+    as it does when the script is run with exec. If the script isn't in the traceback, e.g. a timeout while the
+    loop is waiting, it's returned unchanged.
+    """
+    start = tb
+    while tb.tb_next:
+        if tb.tb_next.tb_frame.f_code.co_filename == filename:
+            return tb
+        tb = tb.tb_next
+    return start
+
+
+def render_cached(file: Path, cache_file: Path, *, file_text: Optional[str] = None) -> Optional[List[Section]]:
+    """
+    Build sections from a script using the prints and plots from its last execution,
+    returns None if the cache is missing or the executable code has changed.
+    """
+    if file_text is None:
+        file_text = file.read_text('utf-8')
+    extra = cache.load(cache_file, file_text)
+    if extra is None:
+        return None
+    return make_sections(file_text, extra)
+
+
+def make_sections(file_text: str, extra: List[Union[PrintStatement, PlotBlock]]) -> List[Section]:
+    lines: List[Union[str, PrintStatement, PlotBlock]] = file_text.split('\n')
+
+    # iterate from the end of the file backwards, prints from the same line (e.g. in a loop or from concurrent tasks)
+    # are inserted at the same position so they're also reversed to keep them in the order they happened
+    for p in sorted(reversed(extra), key=attrgetter('line_no'), reverse=True):
         if isinstance(p, PrintStatement):
             for back in range(1, 100):
                 m = re.search(r'^( *)print\(', lines[p.line_no - back])
@@ -53,26 +117,16 @@ def exec_file(file: Path) -> List[Section]:
     return MakeSections(lines).sections
 
 
-def simplify(obj):
-    from dataclasses import is_dataclass, fields
-
-    if is_dataclass(obj):
-        return {'*type': obj.__class__.__name__, **{f.name: simplify(getattr(obj, f.name)) for f in fields(obj)}}
-    elif isinstance(obj, list):
-        return [simplify(v) for v in obj]
-    else:
-        return obj
-
-
 class MakeSections:
     def __init__(self, lines: List[Union[str, PrintStatement, PlotBlock]]):
         self.iter = iter(lines)
         self.sections: List[Section] = []
         self.current_name: Optional[str] = None
         self.current_code: Optional[CodeBlock] = None
+        self.line_no = 0
         try:
             while True:
-                line = next(self.iter)
+                line = self.next_line()
                 if isinstance(line, str):
                     if self.section_divide(line):
                         continue
@@ -89,11 +143,17 @@ class MakeSections:
             pass
         self.maybe_add_current_code()
 
+    def next_line(self) -> Union[str, PrintStatement, PlotBlock]:
+        line = next(self.iter)
+        if isinstance(line, str):
+            self.line_no += 1
+        return line
+
     def section_divide(self, line: str) -> bool:
         start = re.match(r' *# *{ *(.*)', line)
         if start:
             self.maybe_add_current_code()
-            self.current_code = CodeBlock([])
+            self.current_code = CodeBlock([], start_line=self.line_no + 1)
             self.current_name = start.group(1) or None
             return True
         end = re.match(r' *# *} *(.*)', line)
@@ -119,7 +179,7 @@ class MakeSections:
         else:
             lines = [first_line]
         while True:
-            line = next(self.iter)
+            line = self.next_line()
             end = re.match(f'(.*){quotes}', line)
             if end:
                 if renderer:
@@ -134,7 +194,7 @@ class MakeSections:
             self.maybe_add_current_code()
             self.sections.append(Section(TextBlock('\n'.join(lines), renderer)))
             if was_in_section:
-                self.current_code = CodeBlock([])
+                self.current_code = CodeBlock([], start_line=self.line_no + 1)
         elif self.current_code:
             self.current_code.lines.extend(lines)
         else:
@@ -172,9 +232,11 @@ default = object()
 
 
 class MockPrint:
-    def __init__(self, file: Path):
+    def __init__(self, file: Path, *, max_output: Optional[int] = None):
         self.file = file
         self.statements: List[PrintStatement] = []
+        self.max_output = max_output
+        self.output_size = 0
 
     def __call__(self, *args, file: Optional[BufferedWriter] = default, flush=None):
         if file is not default:
@@ -188,6 +250,10 @@ class MockPrint:
             raise RuntimeError('in another file, todo')
 
         args = [parse_print_value(arg) for arg in args]
+        if self.max_output is not None:
+            self.output_size += sum(len(a.content) for a in args)
+            if self.output_size > self.max_output:
+                raise LimitExceeded(f'output limit of {self.max_output:,} characters exceeded')
         self.statements.append(PrintStatement(args, frame.f_lineno))
 
 
@@ -197,7 +263,7 @@ def parse_print_value(value: Any) -> PrintArg:
     """
     # attempt to build a pretty equivalent of the print output
     if not isinstance(value, (str, int, float)):
-        return PrintArg(pformat(value), 'py')
+        return parse_table(value) or PrintArg(pformat(value), 'py')
     elif (
         isinstance(value, str)
         and len(value) > 10
@@ -212,3 +278,56 @@ def parse_print_value(value: Any) -> PrintArg:
             return PrintArg(json.dumps(obj, indent=2), 'json')
 
     return PrintArg(str(value), 'str')
+
+
+def parse_table(value: Any) -> Optional[PrintArg]:
+    """
+    Build a table from the first and last rows of pandas DataFrames and Series and 1 or 2 dimensional numpy arrays,
+    only the rows shown are accessed so this is fast for large objects.
+
+    pandas and numpy aren't imported here, objects are identified by their type.
+    """
+    cls = type(value)
+    package, name = cls.__module__.split('.', 1)[0], cls.__name__
+    if package == 'pandas' and name in {'DataFrame', 'Series'}:
+        if name == 'Series':
+            row_count, column_count = len(value), 1
+            columns = [str(value.name) if value.name is not None else '']
+        else:
+            row_count, column_count = value.shape
+            columns = [str(c) for c in value.columns[:TABLE_COLUMNS]]
+
+        def get_rows(start: int, stop: int) -> List[list]:
+            part = value.iloc[start:stop] if name == 'Series' else value.iloc[start:stop, :TABLE_COLUMNS]
+            values = part.to_numpy().tolist()
+            return [[i, *(v if name == 'DataFrame' else [v])] for i, v in zip(part.index.tolist(), values)]
+
+    elif package == 'numpy' and name == 'ndarray' and value.ndim in {1, 2}:
+        row_count = value.shape[0]
+        column_count = value.shape[1] if value.ndim == 2 else 1
+        columns = [str(i) for i in range(min(column_count, TABLE_COLUMNS))] if value.ndim == 2 else ['']
+
+        def get_rows(start: int, stop: int) -> List[list]:
+            part = value[start:stop, :TABLE_COLUMNS] if value.ndim == 2 else value[start:stop, None]
+            return [[start + i, *row] for i, row in enumerate(part.tolist())]
+
+    else:
+        return None
+
+    head = get_rows(0, TABLE_ROWS)
+    tail = get_rows(max(TABLE_ROWS, row_count - TABLE_ROWS), row_count)
+    table = {
+        'columns': columns,
+        'head': [[format_cell(v) for v in row] for row in head],
+        'tail': [[format_cell(v) for v in row] for row in tail],
+        'row_count': row_count,
+        'column_count': column_count,
+    }
+    return PrintArg(json.dumps(table), 'table')
+
+
+def format_cell(value: Any) -> str:
+    s = str(value)
+    if len(s) > TABLE_CELL_LENGTH:
+        s = s[: TABLE_CELL_LENGTH - 1] + '…'
+    return s
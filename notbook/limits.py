@@ -0,0 +1,117 @@
+import os
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # not available on windows
+    resource = None
+
+__all__ = 'Limits', 'LimitExceeded', 'apply_limits', 'run_in_subprocess', 'preload'
+# time to wait after the timeout before killing a process that hasn't stopped
+KILL_GRACE = 5
+# packages imported by notbook.preload, see preload()
+PRELOAD_ENV = 'NOTBOOK_PRELOAD'
+
+
+@dataclass
+class Limits:
+    # wall clock time in seconds
+    timeout: Optional[float] = None
+    # address space in bytes, only applied where the resource module is available
+    memory: Optional[int] = None
+    # total number of characters printed
+    output: Optional[int] = None
+
+
+class LimitExceeded(BaseException):
+    """
+    Raised inside the script when a limit is exceeded, this inherits from BaseException so it's not caught
+    by "except Exception" in the script.
+    """
+
+
+@contextmanager
+def apply_limits(limits: Optional[Limits]):
+    """
+    Apply the time and memory limits while executing a script, the output limit is enforced by MockPrint.
+    """
+    if limits is None:
+        yield
+        return
+
+    use_alarm = (
+        limits.timeout is not None
+        and hasattr(signal, 'setitimer')
+        and threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+
+        def on_alarm(signum, frame):
+            raise LimitExceeded(f'timeout of {limits.timeout:0.1f}s exceeded')
+
+        prev_handler = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, limits.timeout)
+
+    prev_memory = None
+    if limits.memory is not None and resource is not None:
+        prev_memory = resource.getrlimit(resource.RLIMIT_AS)
+        hard = prev_memory[1]
+        soft = limits.memory if hard == resource.RLIM_INFINITY else min(limits.memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+    try:
+        yield
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, prev_handler)
+        if prev_memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, prev_memory)
+
+
+def run_in_subprocess(target: Callable[..., Any], args: Tuple, timeout: Optional[float] = None) -> Optional[int]:
+    """
+    Run target in a new process, returns its exit code or None if it was killed after not stopping within
+    KILL_GRACE seconds of timeout. Timeouts should also be enforced inside the process, this is a fallback in case
+    the script can't be interrupted, e.g. when it's stuck in C code.
+    """
+    process = process_context().Process(target=target, args=args)
+    # so output from the process isn't shown before output from this process
+    sys.stdout.flush()
+    process.start()
+    process.join(timeout + KILL_GRACE if timeout else None)
+    if process.is_alive():
+        process.kill()
+        process.join()
+        return None
+    return process.exitcode
+
+
+def process_context():
+    """
+    Processes are forked from a forkserver where possible, rather than from this process which may have other
+    threads, so they don't risk deadlocks and their exit codes can be trusted.
+    """
+    # imported here since it's only needed when building in a subprocess
+    import multiprocessing
+
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def preload(packages: List[str]) -> None:
+    """
+    Import notbook and packages in the forkserver so processes forked from it are "warm" and needn't import them
+    again, this must be called before the first process is started.
+    """
+    ctx = process_context()
+    if ctx.get_start_method() == 'forkserver':
+        os.environ[PRELOAD_ENV] = ','.join(packages)
+        # a module which fails to import would otherwise kill the forkserver
+        ctx.set_forkserver_preload(['notbook.preload'])
@@ -1,25 +1,172 @@
 import shutil
+import sys
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, List, Optional
 
-from .exec import exec_file
-from .render import render, render_exception
-from .render_tools import ExecException
+from . import cache, manifest
+from .assets import ASSETS_DIR, Assets
+from .exec import exec_file, render_cached
+from .limits import Limits
+from .models import Section
+from .render import render, render_exception, render_index
+from .render_tools import ExecException, SourceHighlighter
 
-__all__ = 'build', 'prepare'
+__all__ = 'Notebook', 'find_notebooks', 'build', 'build_cached', 'prepare_notebooks', 'write_error', 'prepare'
 
 
-def build(exec_file_path: Path, output_dir: Path, *, reload: bool = False, dev: bool = False) -> None:
-    if not reload and not dev:
-        prepare(output_dir)
+@dataclass(eq=False)
+class Notebook:
+    # path segment the notebook is served under and its output directory, empty when building a single file
+    name: str
+    exec_file_path: Path
+    output_dir: Path
+
+
+def find_notebooks(path: Path, output_dir: Path) -> Dict[str, Notebook]:
+    """
+    A single file is built in output_dir, for directories every python file not starting with an underscore is
+    built in "output_dir/<file stem>/".
+    """
+    if path.is_file():
+        return {'': Notebook('', path, output_dir)}
+    notebooks = {}
+    for p in sorted(path.glob('*.py')):
+        if not p.name.startswith('_'):
+            notebooks[p.stem] = Notebook(p.stem, p, output_dir / p.stem)
+    return notebooks
+
+
+def build(
+    exec_file_path: Path,
+    output_dir: Path,
+    *,
+    reload: bool = False,
+    dev: bool = False,
+    limits: Optional[Limits] = None,
+    force: bool = False,
+    assets_dir: Optional[Path] = None,
+    inline: bool = False,
+) -> bool:
+    """
+    Execute a script and render its output, returns False if the build was skipped because none of the script's
+    inputs have changed since the last build, use force to always build.
+
+    Static files are saved in assets_dir, "output_dir/assets/" by default, or embedded in the page with inline.
+    """
+    assets = Assets(assets_dir or output_dir / ASSETS_DIR, output_dir, inline=inline)
+    use_manifest = not reload and not dev
+    if use_manifest:
+        if force:
+            prepare(output_dir)
+        elif is_fresh(exec_file_path, output_dir, assets):
+            return False
+        else:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            manifest.clear(output_dir)
+
+    cache_file = output_dir / cache.CACHE_FILE
+    file_text = exec_file_path.read_text('utf-8')
     try:
-        sections = exec_file(exec_file_path)
+        with manifest.track_inputs(exec_file_path, output_dir) as data_files:
+            sections = exec_file(exec_file_path, file_text=file_text, cache_file=cache_file, limits=limits)
     except ExecException as exc:
-        if reload:
-            content = render_exception(exc, reload=reload, dev=dev)
-        else:
+        # the cached results no longer reflect what the script does
+        cache.clear(cache_file)
+        if not reload and not exc.limit_exceeded:
             raise
+        # show the output collected before the error
+        highlighter = SourceHighlighter(file_text)
+        content = render_exception(exc, highlighter=highlighter, assets=assets, reload=reload)
+        (output_dir / 'index.html').write_text(content)
+        if not reload:
+            raise
+    else:
+        content = render_page(sections, file_text, output_dir, assets=assets, reload=reload)
+        (output_dir / 'index.html').write_text(content)
+        # saved by every build so build_cached() can tell when modules or data files have changed
+        manifest.save(output_dir, manifest.create(exec_file_path, data_files, assets.manifest(), reload=reload))
+    return True
+
+
+def is_fresh(exec_file_path: Path, output_dir: Path, assets: Assets) -> bool:
+    m = manifest.load(output_dir)
+    return (
+        manifest.is_fresh(m, exec_file_path)
+        and not m.get('reload')
+        and assets.is_fresh(m.get('assets'))
+        and (output_dir / 'index.html').exists()
+    )
+
+
+def prepare_notebooks(
+    output_dir: Path, notebooks: Dict[str, Notebook], *, force: bool = False, inline: bool = False
+) -> None:
+    """
+    Prepare output_dir for building a directory of notebooks: write the index page and remove output from notebooks
+    which no longer exist, with force output_dir is cleared. Static files are shared by all notebooks in
+    "output_dir/assets/".
+    """
+    if '' in notebooks:
+        # single file, build() prepares the output directory
+        return
+    if force:
+        prepare(output_dir)
     else:
-        content = render(sections, reload=reload, dev=dev)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for p in output_dir.iterdir():
+            if p.is_dir() and p.name not in notebooks and (p / manifest.MANIFEST_FILE).exists():
+                shutil.rmtree(p)
+    assets = Assets(output_dir / ASSETS_DIR, output_dir, inline=inline)
+    (output_dir / 'index.html').write_text(render_index(sorted(notebooks), assets=assets))
+
+
+def build_cached(
+    exec_file_path: Path,
+    output_dir: Path,
+    *,
+    reload: bool = False,
+    assets_dir: Optional[Path] = None,
+    inline: bool = False,
+) -> bool:
+    """
+    Re-render the page using the prints and plots from the last build without executing the script,
+    returns False if that's not possible because the executable code, a local module it imports or a data file it
+    read has changed.
+    """
+    m = manifest.load(output_dir)
+    if not manifest.is_fresh(m, exec_file_path, script=False):
+        return False
+    file_text = exec_file_path.read_text('utf-8')
+    sections = render_cached(exec_file_path, output_dir / cache.CACHE_FILE, file_text=file_text)
+    if sections is None:
+        return False
+    assets = Assets(assets_dir or output_dir / ASSETS_DIR, output_dir, inline=inline)
+    content = render_page(sections, file_text, output_dir, assets=assets, reload=reload)
+    (output_dir / 'index.html').write_text(content)
+    # the page may now use different assets, the rest of the manifest still describes the last build
+    m.update(assets=assets.manifest(), reload=reload)
+    manifest.save(output_dir, m)
+    return True
+
+
+def render_page(sections: List[Section], file_text: str, output_dir: Path, *, assets: Assets, reload: bool) -> str:
+    highlight_cache_file = output_dir / cache.HIGHLIGHT_CACHE_FILE
+    highlighter = SourceHighlighter(file_text, cache.load_highlights(highlight_cache_file))
+    content = render(sections, highlighter=highlighter, assets=assets, reload=reload)
+    cache.save_highlights(highlight_cache_file, highlighter.used_cache)
+    return content
+
+
+def write_error(output_dir: Path, assets_dir: Path, exc: BaseException, *, reload: bool = False) -> None:
+    """
+    Write an error page for a build which failed without raising ExecException, e.g. because it was killed.
+    """
+    try:
+        raise exc
+    except BaseException:
+        exec_exc = ExecException(sys.exc_info())
+    content = render_exception(exec_exc, assets=Assets(assets_dir, output_dir), reload=reload)
     (output_dir / 'index.html').write_text(content)
 
 
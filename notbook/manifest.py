@@ -0,0 +1,175 @@
+import ast
+import hashlib
+import json
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .version import VERSION
+
+__all__ = 'MANIFEST_FILE', 'track_inputs', 'create', 'is_fresh', 'load', 'save', 'clear', 'package_imports'
+
+MANIFEST_FILE = '.notbook-manifest.json'
+_tracking: Optional[Dict[str, object]] = None
+
+
+def file_hash(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def load(output_dir: Path) -> Optional[dict]:
+    try:
+        return json.loads((output_dir / MANIFEST_FILE).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save(output_dir: Path, manifest: dict) -> None:
+    (output_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+
+
+def clear(output_dir: Path) -> None:
+    path = output_dir / MANIFEST_FILE
+    if path.exists():
+        path.unlink()
+
+
+def create(exec_file_path: Path, data_files: Iterable[Path], assets: Dict[str, Any], *, reload: bool = False) -> dict:
+    """
+    Record everything which could change a notebook's output: notbook itself, the script, local modules it
+    imports, data files it read, the assets used by the page, see Assets.manifest(), and whether the page was built
+    for "notbook watch".
+    """
+    exec_file_path = exec_file_path.resolve()
+    modules = local_modules(exec_file_path)
+    return {
+        'version': VERSION,
+        'script': {str(exec_file_path): file_hash(exec_file_path)},
+        'modules': {str(p): file_hash(p) for p in modules},
+        'data': {str(p): file_hash(p) for p in sorted(set(data_files) - set(modules) - {exec_file_path})},
+        'assets': assets,
+        'reload': reload,
+    }
+
+
+def is_fresh(manifest: Optional[dict], exec_file_path: Path, *, script: bool = True) -> bool:
+    """
+    Check whether the inputs recorded in a manifest are unchanged, in which case the notebook needn't be built,
+    assets are checked separately with Assets.is_fresh(). With script=False the script itself isn't checked,
+    the exec cache already knows whether its code has changed.
+    """
+    exec_file_path = exec_file_path.resolve()
+    if not manifest or manifest.get('version') != VERSION or str(exec_file_path) not in manifest['script']:
+        return False
+    if set(map(Path, manifest['modules'])) != set(local_modules(exec_file_path)):
+        # imports have changed
+        return False
+    files = {**(manifest['script'] if script else {}), **manifest['modules'], **manifest['data']}
+    return all(file_hash(Path(path)) == h for path, h in files.items())
+
+
+def local_modules(exec_file_path: Path) -> List[Path]:
+    """
+    Find modules imported by a script, and modules they import, which are in the same directory or a sub-directory.
+    """
+    root = exec_file_path.resolve().parent
+    found: Set[Path] = set()
+    to_check = [exec_file_path.resolve()]
+    while to_check:
+        path = to_check.pop()
+        for name in imported_names(path):
+            for module_path in module_files(root, name):
+                if module_path not in found:
+                    found.add(module_path)
+                    to_check.append(module_path)
+    return sorted(found)
+
+
+def package_imports(exec_file_paths: Iterable[Path]) -> List[str]:
+    """
+    Find the top level packages imported by scripts and the local modules they import, excluding local modules,
+    e.g. "pandas" for "import pandas.io.json".
+    """
+    packages: Set[str] = set()
+    for exec_file_path in exec_file_paths:
+        root = exec_file_path.resolve().parent
+        for path in [exec_file_path, *local_modules(exec_file_path)]:
+            for name in imported_names(path):
+                package = name.split('.', 1)[0]
+                if package != '__future__' and not module_files(root, package):
+                    packages.add(package)
+    return sorted(packages)
+
+
+def imported_names(path: Path) -> List[str]:
+    try:
+        tree = ast.parse(path.read_text('utf-8'))
+    except (OSError, SyntaxError, ValueError):
+        return []
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            # "from x import y" where y could be a module or an attribute of x
+            names.extend([node.module, *(f'{node.module}.{a.name}' for a in node.names)])
+    return names
+
+
+def module_files(root: Path, name: str) -> List[Path]:
+    files = []
+    parent = root
+    for part in name.split('.'):
+        for path in (parent / part / '__init__.py', parent / f'{part}.py'):
+            if path.is_file():
+                files.append(path)
+                break
+        else:
+            break
+        parent = parent / part
+    return files
+
+
+@contextmanager
+def track_inputs(exec_file_path: Path, output_dir: Path):
+    """
+    Record files read while executing a script which are in the script's directory or the current working directory,
+    files in output_dir are ignored.
+    """
+    global _tracking
+    roots = {exec_file_path.parent.resolve(), Path.cwd().resolve()}
+    files: Set[Path] = set()
+    _tracking = {'roots': roots, 'exclude': output_dir.resolve(), 'files': files}
+    try:
+        yield files
+    finally:
+        _tracking = None
+
+
+def _audit_hook(event: str, args: tuple) -> None:
+    if event != 'open' or _tracking is None:
+        return
+    path, mode, flags = args
+    if not isinstance(path, (str, bytes, os.PathLike)):
+        # file descriptor
+        return
+    if mode is not None and any(c in mode for c in 'wax+'):
+        return
+    if mode is None and isinstance(flags, int) and flags & (os.O_WRONLY | os.O_RDWR):
+        return
+    p = Path(os.fsdecode(path)).resolve()
+    if p.suffix == '.pyc' or not any(r in p.parents for r in _tracking['roots']):
+        return
+    exclude: Path = _tracking['exclude']
+    if p == exclude or exclude in p.parents or not p.is_file():
+        return
+    _tracking['files'].add(p)
+
+
+# audit hooks can't be removed so it's added once and does nothing unless track_inputs is active
+sys.addaudithook(_audit_hook)
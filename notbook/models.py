@@ -4,8 +4,9 @@ from typing import List, Literal, Optional, Union
 
 @dataclass
 class PrintArg:
+    # for tables content is JSON, see exec.parse_table
     content: str
-    format: Literal['py', 'json', 'str']
+    format: Literal['py', 'json', 'str', 'table']
 
 
 @dataclass
@@ -30,6 +31,8 @@ class TextBlock:
 class CodeBlock:
     lines: List[Union[str, PrintBlock]]
     format: Literal['py'] = 'py'
+    # line number in the source file of the first line, 0 if unknown
+    start_line: int = 0
 
 
 @dataclass
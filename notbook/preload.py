@@ -0,0 +1,16 @@
+"""
+Imported by the forkserver which runs builds so the processes forked from it start with notbook and the packages
+notebooks use already imported, see limits.preload().
+"""
+import os
+from importlib import import_module
+
+from . import main  # noqa: F401
+from .limits import PRELOAD_ENV
+
+for name in filter(None, os.getenv(PRELOAD_ENV, '').split(',')):
+    try:
+        import_module(name)
+    except Exception:
+        # the error is shown when the notebook is run
+        pass
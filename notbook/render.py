@@ -1,54 +1,72 @@
+import json
 import re
 from pathlib import Path
-from typing import Dict, Generator, List
+from typing import Dict, Generator, List, Optional
 
 from jinja2 import Environment, PackageLoader
+from markupsafe import Markup, escape
 
+from .assets import Assets
 from .models import CodeBlock, PlotBlock, PrintBlock, PrintStatement, Section, TextBlock
-from .render_tools import ExecException, highlight_code, render_markdown
+from .render_tools import ExecException, SourceHighlighter, highlight_code, render_markdown
 
 THIS_DIR = Path(__file__).parent.resolve()
-__all__ = 'render', 'render_exception'
-
-assets_gist = (
-    'https://gistcdn.githack.com/samuelcolvin/647671890d647695930ff74f1ca5bfc2/raw/'
-    '9bdb8ecebe25293cad8332cbb2a79d844cdfd9a3'
-)
-github_icon_url = f'{assets_gist}/github.png'
-css_url = f'{assets_gist}/notbook.css'
-reload_js_url = f'{assets_gist}/reload.js'
+__all__ = 'render', 'render_exception', 'render_index'
+
+
+def render(
+    sections: List[Section],
+    *,
+    highlighter: Optional[SourceHighlighter] = None,
+    assets: Optional[Assets] = None,
+    reload: bool = False,
+) -> str:
+    template = get_env().get_template('main.jinja')
+    bokeh_plot = any(isinstance(s.block, PlotBlock) and s.block.format == 'bokeh' for s in sections)
+    return template.render(
+        sections=render_sections(sections, highlighter),
+        bokeh_plot=bokeh_plot,
+        **(assets or Assets()).page_globals(reload=reload, bokeh=bokeh_plot),
+    )
 
 
-def render(sections: List[Section], *, reload: bool = False, dev: bool = False) -> str:
-    template = get_env(reload, dev).get_template('main.jinja')
+def render_exception(
+    exc: ExecException,
+    *,
+    highlighter: Optional[SourceHighlighter] = None,
+    assets: Optional[Assets] = None,
+    reload: bool = False,
+) -> str:
+    template = get_env().get_template('error.jinja')
+    bokeh_plot = any(isinstance(s.block, PlotBlock) and s.block.format == 'bokeh' for s in exc.sections)
     return template.render(
-        sections=render_sections(sections),
-        bokeh_plot=any(isinstance(s.block, PlotBlock) and s.block.format == 'bokeh' for s in sections),
+        exception=exc.format('html'),
+        sections=render_sections(exc.sections, highlighter),
+        bokeh_plot=bokeh_plot,
+        **(assets or Assets()).page_globals(reload=reload, bokeh=bokeh_plot),
     )
 
 
-def render_exception(exc: ExecException, *, reload: bool = False, dev: bool = False) -> str:
-    template = get_env(reload, dev).get_template('error.jinja')
-    return template.render(exception=exc.format('html'))
+def render_index(notebooks: List[str], *, assets: Optional[Assets] = None, reload: bool = False) -> str:
+    template = get_env().get_template('index.jinja')
+    return template.render(notebooks=notebooks, **(assets or Assets()).page_globals(reload=reload))
 
 
-def get_env(reload: bool, dev: bool) -> Environment:
+def get_env() -> Environment:
     env = Environment(loader=PackageLoader('notbook'), autoescape=True)
     env.globals.update(
         highlight=highlight_code,
         title='Notbook',
         description='An experiment in displaying python scripts.',
-        css_url='/assets/main.css' if dev else css_url,
-        github_icon_url=github_icon_url,
         repo='samuelcolvin/notbook',
     )
-    if reload:
-        env.globals['reload_js_url'] = '/assets/reload.js' if dev else reload_js_url
-    env.filters.update(is_simple=is_simple)
+    env.filters.update(is_simple=is_simple, has_table=has_table, table=render_table)
     return env
 
 
-def render_sections(sections: List[Section]) -> Generator[Dict[str, str], None, None]:
+def render_sections(
+    sections: List[Section], highlighter: Optional[SourceHighlighter]
+) -> Generator[Dict[str, str], None, None]:
     for section in sections:
         b = section.block
         d = dict(
@@ -59,7 +77,7 @@ def render_sections(sections: List[Section]) -> Generator[Dict[str, str], None,
         if isinstance(b, TextBlock):
             d['html'] = b.content if b.format == 'html' else render_markdown(b.content)
         elif isinstance(b, CodeBlock):
-            d['code'] = render_code(b)
+            d['code'] = render_code(b, highlighter)
         elif isinstance(b, PrintBlock):
             d['print_statements'] = b.statements
         else:
@@ -68,20 +86,58 @@ def render_sections(sections: List[Section]) -> Generator[Dict[str, str], None,
         yield d
 
 
-def render_code(c: CodeBlock):
+def render_code(c: CodeBlock, highlighter: Optional[SourceHighlighter]):
     code = []
+    line_no = c.start_line
     for line in c.lines:
         if isinstance(line, str):
             code.append(line)
         else:
             assert isinstance(line, PrintBlock), line
             if code:
-                yield {'format': 'py', 'content': '\n'.join(code)}
+                yield code_chunk(code, line_no, highlighter)
+                line_no += len(code)
                 code = []
             yield line.statements
     if code:
-        yield {'format': 'py', 'content': '\n'.join(code)}
+        yield code_chunk(code, line_no, highlighter)
+
+
+def code_chunk(code: List[str], line_no: int, highlighter: Optional[SourceHighlighter]) -> Dict[str, str]:
+    if highlighter and line_no:
+        html = highlighter.chunk(line_no, len(code))
+    else:
+        html = highlight_code('py', '\n'.join(code))
+    return {'format': 'py', 'html': html}
 
 
 def is_simple(p: PrintStatement) -> bool:
     return all(a.format == 'str' for a in p.args)
+
+
+def has_table(p: PrintStatement) -> bool:
+    return any(a.format == 'table' for a in p.args)
+
+
+def render_table(content: str) -> Markup:
+    """
+    Render a table PrintArg as HTML, an ellipsis row or column is shown where rows or columns were omitted.
+    """
+    t = json.loads(content)
+    more_columns = t['column_count'] > len(t['columns'])
+    rows = t['head'] + t['tail']
+    if t['row_count'] > len(rows):
+        # there's a gap between head and tail
+        rows = t['head'] + [None] + t['tail']
+
+    def tr(cells: List[str], cell_tag: str) -> str:
+        c = ''.join(f'<{cell_tag}>{escape(v)}</{cell_tag}>' for v in cells)
+        return f'<tr>{c}{f"<{cell_tag}>…</{cell_tag}>" if more_columns else ""}</tr>'
+
+    head = tr(['', *t['columns']], 'th')
+    body = ''.join(tr(['…'] * (len(t['columns']) + 1), 'td') if r is None else tr(r, 'td') for r in rows)
+    summary = f'{t["row_count"]:,} rows × {t["column_count"]:,} columns'
+    return Markup(
+        f'<div class="print-table"><table class="table table-sm table-dark">'
+        f'<thead>{head}</thead><tbody>{body}</tbody></table><small>{summary}</small></div>'
+    )
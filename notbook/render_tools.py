@@ -1,22 +1,33 @@
+import io
 import re
+import tokenize
 import traceback
-from typing import Literal
+from functools import lru_cache
+from typing import Dict, List, Literal, Optional
 
 from markupsafe import Markup
 from misaka import HtmlRenderer, Markdown, escape_html
 from pygments import highlight as pyg_highlight
 from pygments.formatters import HtmlFormatter, Terminal256Formatter
-from pygments.lexers import Python3TracebackLexer, get_lexer_by_name
+from pygments.lexer import Lexer
+from pygments.lexers import Python3TracebackLexer, PythonLexer, get_lexer_by_name
 from pygments.util import ClassNotFound
 
-__all__ = 'render_markdown', 'code_block', 'highlight_code', 'slugify', 'ExecException'
+from .limits import LimitExceeded
+from .models import Section
+
+__all__ = 'render_markdown', 'code_block', 'highlight_code', 'SourceHighlighter', 'slugify', 'ExecException'
 
 MD_EXTENSIONS = 'fenced-code', 'strikethrough', 'no-intra-emphasis', 'tables'
 DL_REGEX = re.compile('<li>(.*?)::(.*?)</li>', re.S)
 LI_REGEX = re.compile('<li>(.*?)</li>', re.S)
+# longer code passed to highlight_code() isn't cached
+HIGHLIGHT_CACHE_MAX = 2048
 tb_lexer = Python3TracebackLexer()
 shell_formatter = Terminal256Formatter(style='vim')
 html_formatter = HtmlFormatter(nowrap=True)
+# unlike the lexers returned by get_lexer this doesn't strip whitespace so line numbers are preserved
+source_lexer = PythonLexer(stripnl=False, ensurenl=False)
 
 
 class CustomHtmlRenderer(HtmlRenderer):
@@ -52,12 +63,22 @@ def code_block(lang: str, code: str) -> str:
     return f'<div><pre class="code-block">{highlight_code(lang, code)}</pre></div>'
 
 
-def highlight_code(format: str, code: str) -> Markup:
+@lru_cache(maxsize=None)
+def get_lexer(format: str) -> Optional[Lexer]:
     try:
-        lexer = get_lexer_by_name(format, stripall=True)
+        return get_lexer_by_name(format, stripall=True)
     except ClassNotFound:
-        lexer = None
+        return None
 
+
+def highlight_code(format: str, code: str) -> Markup:
+    if len(code) <= HIGHLIGHT_CACHE_MAX:
+        return _highlight_code_cached(format, code)
+    return _highlight_code(format, code)
+
+
+def _highlight_code(format: str, code: str) -> Markup:
+    lexer = get_lexer(format)
     if lexer:
         h = pyg_highlight(code, lexer=lexer, formatter=html_formatter).strip('\n')
         return Markup(f'<span class="highlight">{h}</span>')
@@ -65,6 +86,80 @@ def highlight_code(format: str, code: str) -> Markup:
         return Markup(f'<span class="raw">{escape_html(code)}</span>')
 
 
+# short values are often printed repeatedly, e.g. in a loop, long ones aren't cached so they're not kept in memory
+_highlight_code_cached = lru_cache(maxsize=1024)(_highlight_code)
+
+
+class SourceHighlighter:
+    """
+    Highlight a python file once so code chunks can be sliced from it by line number.
+
+    Lines are split into groups (a single line unless it's part of a multiline string) and groups are looked up
+    in line_cache before being highlighted, so with a cache that's kept between builds only changed lines
+    need highlighting. used_cache contains just the groups from this file, use it to save the cache.
+    """
+
+    def __init__(self, source: str, line_cache: Dict[str, str] = None):
+        self.line_cache = {} if line_cache is None else line_cache
+        self.used_cache: Dict[str, str] = {}
+        source_lines = source.split('\n')
+        groups = ['\n'.join(source_lines[start:end]) for start, end in line_groups(source)]
+
+        # highlight all new groups in one go, groups always start and end at token boundaries so this is
+        # equivalent to highlighting them individually
+        new_groups = list(dict.fromkeys(g for g in groups if g not in self.line_cache))
+        if new_groups:
+            h = pyg_highlight('\n'.join(new_groups), lexer=source_lexer, formatter=html_formatter)
+            h_lines = iter(h.split('\n'))
+            for g in new_groups:
+                self.line_cache[g] = '\n'.join(next(h_lines) for _ in range(g.count('\n') + 1))
+
+        self.lines: List[str] = []
+        for g in groups:
+            h = self.used_cache[g] = self.line_cache[g]
+            self.lines.extend(h.split('\n'))
+
+    def chunk(self, start_line: int, line_count: int) -> Markup:
+        """
+        Get highlighted lines starting at start_line (1-indexed), leading and trailing blank lines are removed.
+        """
+        lines = self.lines[start_line - 1 : start_line - 1 + line_count]
+        while lines and not lines[0].strip():
+            lines.pop(0)
+        while lines and not lines[-1].strip():
+            lines.pop()
+        h = '\n'.join(lines)
+        return Markup(f'<span class="highlight">{h}</span>')
+
+
+def line_groups(source: str) -> List[tuple]:
+    """
+    Find ranges of (0-indexed) lines which need to be highlighted together because a token spans them.
+
+    A string can be split into several multi-line tokens, e.g. f-strings on python 3.12+ are tokenized as
+    start, middle and end tokens, so tokens overlapping the previous group extend it.
+    """
+    line_count = source.count('\n') + 1
+    groups = []
+    line = 0
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            start, end = token.start[0] - 1, token.end[0] - 1
+            if end <= start:
+                continue
+            if start < line:
+                groups[-1] = groups[-1][0], max(line, end + 1)
+            else:
+                groups.extend((i, i + 1) for i in range(line, start))
+                groups.append((start, end + 1))
+            line = max(line, end + 1)
+    except (tokenize.TokenError, SyntaxError):
+        # invalid python, fall back to highlighting everything together
+        return [(0, line_count)]
+    groups.extend((i, i + 1) for i in range(line, line_count))
+    return groups
+
+
 RE_URI_NOT_ALLOWED = re.compile(r'[^a-zA-Z0-9_\-/.]')
 RE_HTML_SYMBOL = re.compile(r'&(?:#\d{2,}|[a-z0-9]{2,});')
 RE_TITLE_NOT_ALLOWED = re.compile(r'[^a-z0-9_\-]')
@@ -82,8 +177,14 @@ def slugify(v, *, path_like=True):
 
 
 class ExecException(Exception):
-    def __init__(self, exc_info):
+    def __init__(self, exc_info, *, sections: List[Section] = None):
         self.exc_info = exc_info
+        # sections built from output captured before the exception
+        self.sections = sections or []
+
+    @property
+    def limit_exceeded(self) -> bool:
+        return isinstance(self.exc_info[1], (LimitExceeded, MemoryError))
 
     def format(self, format: Literal['html', 'shell']) -> str:
         stack = traceback.format_exception(*self.exc_info)
@@ -45,7 +45,9 @@ class ReloadWebsocket {
   connect = () => {
     this._connected = false
     const proto = location.protocol.replace('http', 'ws')
-    const url = `${proto}//${window.location.host}/.reload/ws/`
+    // path lets the server send only reloads for this notebook when serving a directory of notebooks
+    const path = encodeURIComponent(window.location.pathname)
+    const url = `${proto}//${window.location.host}/.reload/ws/?path=${path}`
     console.debug(`websocket connecting to "${url}"...`)
     try {
       this._socket = new WebSocket(url)
@@ -1,18 +1,34 @@
 import asyncio
-from multiprocessing.context import Process
+import os
+from functools import partial
 from pathlib import Path
 from time import time
+from typing import Dict, List, Optional, Set
 
 from aiohttp import web
-from aiohttp.web_exceptions import HTTPMovedPermanently, HTTPNotFound
+from aiohttp.web_exceptions import HTTPFound, HTTPMovedPermanently, HTTPNotFound
 from aiohttp.web_fileresponse import FileResponse
 from aiohttp.web_response import Response
-from watchgod import PythonWatcher, awatch
+from watchgod import Change, PythonWatcher, awatch
 
-from .main import build, prepare
+from . import manifest
+from .assets import ASSETS_DIR, HASHED_NAME, Assets
+from .limits import LimitExceeded, Limits, preload, run_in_subprocess
+from .main import Notebook, build, build_cached, find_notebooks, prepare, write_error
+from .render import render_index
 
 __all__ = ('watch',)
 WS = 'websockets'
+STATS = 'reload_stats'
+NOTEBOOKS = 'notebooks'
+POOL = 'build_pool'
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# how long a single websocket send may take before the client is considered dead
+SEND_TIMEOUT = 2
+# maximum number of unsent messages per client, further messages are dropped
+SEND_QUEUE_SIZE = 4
+# asset names include a hash of their content so they never change
+IMMUTABLE = {'Cache-Control': 'public, max-age=31536000, immutable'}
 
 
 async def static(request):
@@ -27,12 +43,18 @@ async def static(request):
         except Exception as exc:
             # perm error or other kind!
             raise HTTPNotFound() from exc
+    if filepath.is_dir():
+        if not request.path.endswith('/'):
+            raise HTTPFound(request.path + '/')
+        filepath = filepath / 'index.html'
     for _ in range(20):
         if filepath.exists():
             break
         await asyncio.sleep(0.1)
 
     if filepath.is_file():
+        if filepath.parent == directory / ASSETS_DIR and HASHED_NAME.search(filepath.name):
+            return FileResponse(filepath, headers=IMMUTABLE)
         return FileResponse(filepath)
     else:
         raise HTTPNotFound()
@@ -42,68 +64,254 @@ async def server_up(request):
     return Response(body=b'server up\n', content_type='text/plain')
 
 
+def find_notebook(app: web.Application, path: str) -> Optional[Notebook]:
+    notebooks: Dict[str, Notebook] = app[NOTEBOOKS]
+    if '' in notebooks:
+        return notebooks['']
+    return notebooks.get(path.strip('/').split('/', 1)[0])
+
+
+class ReloadClient:
+    """
+    Websocket client with its own bounded queue and sender task, so slow clients don't delay other clients.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, notebook: Optional[Notebook], stats: Dict[str, float]):
+        self.ws = ws
+        # None if the page didn't say which notebook it's showing, it then gets all reload messages
+        self.notebook = notebook
+        self.stats = stats
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+
+    def send(self, msg: str) -> None:
+        try:
+            self.queue.put_nowait((msg, time()))
+        except asyncio.QueueFull:
+            # the client will still reload once it's caught up with the messages already queued
+            self.stats['messages_dropped'] += 1
+
+    async def run(self, clients: Set['ReloadClient']) -> None:
+        try:
+            while True:
+                msg, queued = await self.queue.get()
+                await asyncio.wait_for(self.ws.send_str(msg), SEND_TIMEOUT)
+                latency = time() - queued
+                self.stats['messages_sent'] += 1
+                self.stats['latency_total'] += latency
+                self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+        except (asyncio.TimeoutError, ConnectionError, RuntimeError):
+            # client is stalled or has gone away
+            self.stats['clients_dropped'] += 1
+            clients.discard(self)
+            try:
+                await asyncio.wait_for(self.ws.close(), SEND_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError, RuntimeError):
+                pass
+
+
+def broadcast(app: web.Application, notebook: Notebook, msg: str) -> int:
+    # copy the set since clients may connect or disconnect while we iterate
+    clients = [c for c in list(app[WS]) if c.notebook in {notebook, None}]
+    for client in clients:
+        client.send(msg)
+    return len(clients)
+
+
 async def reload_websocket(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
 
-    request.app[WS].add(ws)
-    async for _ in ws:
-        pass
-
-    request.app[WS].remove(ws)
+    clients: Set[ReloadClient] = request.app[WS]
+    path = request.query.get('path')
+    notebook = path and find_notebook(request.app, path)
+    client = ReloadClient(ws, notebook or None, request.app[STATS])
+    clients.add(client)
+    request.app[STATS]['connections_total'] += 1
+    sender = asyncio.get_event_loop().create_task(client.run(clients))
+    try:
+        async for _ in ws:
+            pass
+    finally:
+        clients.discard(client)
+        sender.cancel()
     return ws
 
 
+async def reload_stats(request):
+    stats = request.app[STATS]
+    sent = stats['messages_sent']
+    return web.json_response(
+        {'connections': len(request.app[WS]), **stats, 'latency_mean': stats['latency_total'] / sent if sent else None}
+    )
+
+
 async def moved(request):
     raise HTTPMovedPermanently('/')
 
 
-def build_in_subprocess(exec_file_path: Path, output_dir: Path, dev: bool):
-    process = Process(target=build, args=(exec_file_path, output_dir), kwargs=dict(reload=True, dev=dev))
-    process.start()
-    process.join()
+def build_in_subprocess(
+    exec_file_path: Path, output_dir: Path, assets_dir: Path, dev: bool, limits: Optional[Limits] = None
+):
+    target = partial(build, reload=True, dev=dev, limits=limits, assets_dir=assets_dir)
+    exitcode = run_in_subprocess(target, (exec_file_path, output_dir), limits and limits.timeout)
+    if exitcode is None:
+        exc = LimitExceeded(f'build killed after exceeding timeout of {limits.timeout:0.1f}s')
+        write_error(output_dir, assets_dir, exc, reload=True)
+    elif exitcode != 0:
+        # build() shows script errors itself, so this is a crash or the process being killed, e.g. by the OOM killer
+        exc = RuntimeError(f'build process failed with exit code {exitcode}')
+        write_error(output_dir, assets_dir, exc, reload=True)
 
 
-async def rebuild(app: web.Application):
-    exec_file_path: Path = app['exec_file_path']
-    output_dir: Path = app['output_dir']
-    dev: bool = app['dev']
-    watcher = awatch(exec_file_path, watcher_cls=PythonWatcher)
-    async for _ in watcher:
-        print(f're-running {exec_file_path}...')
+class BuildPool:
+    """
+    Bounded pool of build workers shared by all notebooks, notebooks with the most browsers connected are built
+    first. Each build runs in a fresh process forked from a forkserver which has already imported notbook and the
+    packages notebooks use, so builds are isolated from each other but don't pay for those imports.
+    """
+
+    def __init__(self, app: web.Application, workers: int):
+        self.app = app
+        self.workers = workers
+        self.pending: List[Notebook] = []
+        # notebooks which must be executed again even if their code hasn't changed
+        self.forced: Set[Notebook] = set()
+        self.building: Set[Notebook] = set()
+        self.condition = asyncio.Condition()
+
+    def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        for _ in range(self.workers):
+            loop.create_task(self.worker())
+
+    async def schedule(self, notebook: Notebook, *, force: bool = False) -> None:
+        async with self.condition:
+            if force:
+                self.forced.add(notebook)
+            if notebook not in self.pending:
+                self.pending.append(notebook)
+                self.condition.notify()
+
+    def connected(self, notebook: Notebook) -> int:
+        return sum(1 for c in self.app[WS] if c.notebook is notebook)
+
+    def ready(self) -> List[Notebook]:
+        # the same notebook is never built twice at once
+        return [nb for nb in self.pending if nb not in self.building]
+
+    async def worker(self) -> None:
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(self.ready)
+                # max() returns the first of equal items, so otherwise notebooks are built in the order scheduled
+                notebook = max(self.ready(), key=self.connected)
+                self.pending.remove(notebook)
+                self.building.add(notebook)
+                force = notebook in self.forced
+                self.forced.discard(notebook)
+            try:
+                await self.build(notebook, force)
+            finally:
+                async with self.condition:
+                    self.building.discard(notebook)
+                    self.condition.notify_all()
+
+    async def build(self, notebook: Notebook, force: bool) -> None:
+        assets_dir: Path = self.app['output_dir'] / ASSETS_DIR
         start = time()
-        await watcher.run_in_executor(build_in_subprocess, exec_file_path, output_dir, dev)
-        for ws in app[WS]:
-            await ws.send_str('reload')
-        c = len(app[WS])
-        print(f'run completed in {time() - start:0.3f}s, {c} browser{"" if c == 1 else "s"} updated')
+        if not force and build_cached(notebook.exec_file_path, notebook.output_dir, reload=True, assets_dir=assets_dir):
+            print(f're-rendered {notebook.exec_file_path} from cached output')
+        else:
+            print(f'running {notebook.exec_file_path}...')
+            args = notebook.exec_file_path, notebook.output_dir, assets_dir, self.app['dev'], self.app['limits']
+            await asyncio.get_event_loop().run_in_executor(None, build_in_subprocess, *args)
+        c = broadcast(self.app, notebook, 'reload')
+        print(f'run completed in {time() - start:0.3f}s, {c} browser{"" if c == 1 else "s"} notified')
+
+
+async def rebuild(app: web.Application):
+    notebooks: Dict[str, Notebook] = app[NOTEBOOKS]
+    pool: BuildPool = app[POOL]
+    watch_path: Path = app['watch_path']
+    async for changes in awatch(watch_path, watcher_cls=PythonWatcher):
+        if watch_path.is_file():
+            await pool.schedule(notebooks[''])
+            continue
+
+        changed = {Path(path).resolve() for change, path in changes if change != Change.deleted}
+        by_path = {nb.exec_file_path.resolve(): nb for nb in notebooks.values()}
+        for path in changed:
+            if path.parent == watch_path.resolve() and path not in by_path and not path.name.startswith('_'):
+                notebook = Notebook(path.stem, path, app['output_dir'] / path.stem)
+                notebook.output_dir.mkdir(parents=True, exist_ok=True)
+                notebooks[notebook.name] = by_path[path] = notebook
+                write_index(app)
+        if changed - set(by_path):
+            # a module which may be imported by notebooks has changed, execute everything again
+            for notebook in notebooks.values():
+                await pool.schedule(notebook, force=True)
+        else:
+            for path in changed:
+                await pool.schedule(by_path[path])
+
+
+def write_index(app: web.Application):
+    notebooks: Dict[str, Notebook] = app[NOTEBOOKS]
+    if '' not in notebooks:
+        output_dir: Path = app['output_dir']
+        content = render_index(sorted(notebooks), assets=Assets(output_dir / ASSETS_DIR, output_dir), reload=True)
+        (output_dir / 'index.html').write_text(content)
 
 
 async def startup(app):
+    pool: BuildPool = app[POOL]
+    pool.start()
+    write_index(app)
+    for notebook in app[NOTEBOOKS].values():
+        await pool.schedule(notebook)
     asyncio.get_event_loop().create_task(rebuild(app))
 
 
-def watch(exec_file_path: Path, output_dir: Path, dev: bool = False):
+def watch(
+    path: Path,
+    output_dir: Path,
+    dev: bool = False,
+    limits: Optional[Limits] = None,
+    *,
+    port: int = 8000,
+    workers: int = DEFAULT_WORKERS,
+):
     if not dev:
         prepare(output_dir)
-    print(f'running {exec_file_path}...')
-    build_in_subprocess(exec_file_path, output_dir, dev)
+    notebooks = find_notebooks(path, output_dir)
+    for notebook in notebooks.values():
+        notebook.output_dir.mkdir(parents=True, exist_ok=True)
+    # packages used by notebooks added later aren't preloaded, they're imported by each build
+    preload(manifest.package_imports(nb.exec_file_path for nb in notebooks.values()))
 
     app = web.Application()
     app.on_startup.append(startup)
     app.update(
-        exec_file_path=exec_file_path, output_dir=output_dir, build=build, dev=dev, websockets=set(),
+        watch_path=path, output_dir=output_dir, dev=dev, limits=limits, websockets=set(),
+    )
+    app[NOTEBOOKS] = notebooks
+    app[POOL] = BuildPool(app, workers)
+    app[STATS] = dict(
+        connections_total=0, clients_dropped=0, messages_sent=0, messages_dropped=0, latency_total=0.0, latency_max=0.0,
     )
     app.add_routes(
         [
             web.get('/.reload/up/', server_up),
             web.get('/.reload/ws/', reload_websocket),
+            web.get('/.reload/stats/', reload_stats),
             web.get('/index.html', moved),
             web.get('/{path:.*}', static),
         ]
     )
 
-    port = 8000
-    print(f'watching {exec_file_path}, serving output at http://localhost:{port}')
+    if path.is_file():
+        print(f'watching {path}, serving output at http://localhost:{port}')
+    else:
+        print(f'watching {len(notebooks)} notebooks in {path}, serving output at http://localhost:{port}')
 
     web.run_app(app, port=port, print=lambda s: None)
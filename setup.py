@@ -1,7 +1,9 @@
+import subprocess
 from importlib.machinery import SourceFileLoader
 from pathlib import Path
 
 from setuptools import setup
+from setuptools.command.build_py import build_py
 
 description = 'Experiment in an alternative to jupyter notebooks'
 THIS_DIR = Path(__file__).resolve().parent
@@ -13,6 +15,27 @@ except FileNotFoundError:
 # avoid loading the package before requirements are installed:
 version = SourceFileLoader('version', 'notbook/version.py').load_module()
 
+
+class BuildPy(build_py):
+    """
+    Build notbook/static/main.css if it's missing so it's included in the package, see "make build-assets".
+    If grablib isn't installed the package is built without it, like editable installs notbook then warns when
+    main.css is used and loads it from a CDN.
+    """
+
+    def run(self):
+        editable = getattr(self, 'editable_mode', False)
+        if not editable and not THIS_DIR.joinpath('notbook', 'static', 'main.css').exists():
+            try:
+                subprocess.run(['grablib'], cwd=THIS_DIR / 'assets', check=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                self.warn(
+                    f'building notbook/static/main.css failed ({e}), it will be loaded from a CDN instead, '
+                    f'run "pip install -r requirements/assets.txt && make build-assets" to build it'
+                )
+        super().run()
+
+
 setup(
     name='notbook',
     version=version.VERSION,
@@ -39,7 +62,8 @@ setup(
     url='https://github.com/samuelcolvin/notbook',
     license='MIT',
     packages=['notbook'],
-    package_data={'notbook': ['templates/*.jinja']},
+    cmdclass={'build_py': BuildPy},
+    package_data={'notbook': ['templates/*.jinja', 'static/*']},
     entry_points="""
         [console_scripts]
         notbook=notbook.__main__:cli